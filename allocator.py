@@ -5,158 +5,221 @@ Handles hierarchical: AddressPool -> Pool -> Subnet
 
 import bisect
 import ipaddress
+import socket
+import struct
+from array import array
+from collections.abc import Iterable
+from functools import lru_cache
+
+
+@lru_cache(maxsize=4096)
+def parse_cidr(cidr: str) -> tuple[int, int, int]:
+    """
+    Parse a CIDR into (start, end, prefix) integers.
+    Host bits are masked off, like IPv4Network(cidr, strict=False).
+    """
+    ip, sep, prefix = cidr.partition("/")
+    if sep and not (prefix.isascii() and prefix.isdigit()):
+        # Netmask/hostmask forms (10.0.0.0/255.255.0.0) and anything odd
+        # go through ipaddress, which accepts or rejects them properly
+        network = ipaddress.IPv4Network(cidr, strict=False)
+        return (
+            int(network.network_address),
+            int(network.broadcast_address),
+            network.prefixlen,
+        )
+
+    prefix_length = int(prefix) if prefix else 32
+    if not 0 <= prefix_length <= 32:
+        raise ValueError(f"Invalid prefix length in {cidr!r}")
+    try:
+        ip_int = struct.unpack("!I", socket.inet_aton(ip))[0]
+    except OSError:
+        raise ValueError(f"Invalid IPv4 address in {cidr!r}") from None
+    mask = (0xFFFFFFFF << (32 - prefix_length)) & 0xFFFFFFFF
+    start = ip_int & mask
+    return start, start | (~mask & 0xFFFFFFFF), prefix_length
+
+
+@lru_cache(maxsize=4096)
+def parse_network(cidr: str) -> ipaddress.IPv4Network:
+    """Parse a CIDR into an IPv4Network (strict=False), cached"""
+    return ipaddress.IPv4Network(cidr, strict=False)
+
+
+def _int_to_dotted(ip_int: int) -> str:
+    """Convert an integer to dotted-quad notation"""
+    return socket.inet_ntoa(struct.pack("!I", ip_int))
+
+
+def num_addresses(cidr: str) -> int:
+    """Number of addresses in a CIDR, from the prefix length alone"""
+    _, sep, prefix = cidr.rpartition("/")
+    if not sep:
+        return 1
+    if not (prefix.isascii() and prefix.isdigit()):
+        # Netmask/hostmask form: let the full parser work out the prefix
+        prefix = parse_cidr(cidr)[2]
+    return 1 << (32 - int(prefix))
+
+
+def _best_fit_core(
+    starts: array,
+    ends: array,
+    parent_start: int,
+    parent_end: int,
+    prefix_length: int,
+) -> tuple[int, int] | None:
+    """
+    Integer core of IPAllocator.find_best_fit.
+    starts/ends must describe sorted, merged ranges. Returns the aligned
+    (alloc_start, alloc_end) of the allocation, or None if nothing fits.
+    """
+    required_size = 1 << (32 - prefix_length)
+
+    # Walk the gaps in one pass, keeping the one with the smallest waste
+    # (closest to required size); the first one wins ties
+    best_start = best_end = 0
+    best_waste = -1
+    prev_end = parent_start - 1
+    for used_start, used_end in zip(starts, ends):
+        gap_end = min(used_start - 1, parent_end)
+        waste = gap_end - prev_end - required_size
+        if waste >= 0 and (best_waste < 0 or waste < best_waste):
+            best_start, best_end, best_waste = prev_end + 1, gap_end, waste
+        prev_end = max(prev_end, used_end)
+
+    # Gap after last range
+    waste = parent_end - prev_end - required_size
+    if waste >= 0 and (best_waste < 0 or waste < best_waste):
+        best_start, best_end, best_waste = prev_end + 1, parent_end, waste
+
+    if best_waste < 0:
+        return None
+
+    gap_start, gap_end = best_start, best_end
+    size_mask = required_size - 1
+
+    # Aligned network boundaries: the first start inside the gap and the
+    # last start whose block still ends inside it
+    first_start = (gap_start + size_mask) & ~size_mask
+    last_start = (gap_end - size_mask) & ~size_mask
+    if first_start > last_start:
+        return None
+
+    # Center of gap, aligned down, clamped into [first_start, last_start]
+    gap_center = gap_start + ((gap_end - gap_start + 1) >> 1)
+    alloc_start = min(max(gap_center & ~size_mask, first_start), last_start)
+    alloc_end = alloc_start + size_mask
+
+    return alloc_start, alloc_end
 
 
 class IPAllocator:
     """Base allocator for hierarchical IP space management"""
 
+    __slots__ = (
+        "parent_cidr",
+        "parent_start",
+        "parent_end",
+        "parent_prefix",
+        "_starts",
+        "_ends",
+    )
+
     def __init__(self, parent_cidr: str):
         self.parent_cidr = parent_cidr
-        self.parent_network = ipaddress.IPv4Network(parent_cidr, strict=False)
-        self.used_ranges: list[tuple[int, int]] = []
-
-    def _ip_to_int(self, ip: str) -> int:
-        return int(ipaddress.IPv4Address(ip))
+        self.parent_start, self.parent_end, self.parent_prefix = parse_cidr(parent_cidr)
+        # Sorted, merged used ranges as parallel int64 arrays (start, end)
+        self._starts = array("q")
+        self._ends = array("q")
 
-    def _int_to_ip(self, ip_int: int) -> str:
-        return str(ipaddress.IPv4Address(ip_int))
+    @property
+    def used_ranges(self) -> list[tuple[int, int]]:
+        """Sorted, merged (start, end) ranges"""
+        return list(zip(self._starts, self._ends))
 
     def _network_range(self, cidr: str) -> tuple[int, int]:
         """Get (start, end) integer range for a CIDR"""
-        network = ipaddress.IPv4Network(cidr, strict=False)
-        return (
-            self._ip_to_int(str(network.network_address)),
-            self._ip_to_int(str(network.broadcast_address)),
-        )
+        return parse_cidr(cidr)[:2]
 
     def add_used_range(self, cidr: str):
         """Add an allocated CIDR to used ranges"""
         start, end = self._network_range(cidr)
-        bisect.insort(self.used_ranges, (start, end))
-        self._merge_ranges()
+        self._insert_range(start, end)
 
-    def _merge_ranges(self):
-        """Merge overlapping/adjacent ranges"""
-        if not self.used_ranges:
+    def bulk_load(self, cidrs: Iterable[str]):
+        """
+        Add many CIDRs at once: sort everything a single time and merge
+        in one linear pass, instead of inserting them one by one
+        """
+        ranges = [self._network_range(cidr) for cidr in cidrs]
+        ranges.extend(zip(self._starts, self._ends))
+        ranges.sort()
+
+        starts = array("q")
+        ends = array("q")
+        for start, end in ranges:
+            if ends and ends[-1] + 1 >= start:  # Overlap or adjacent
+                if end > ends[-1]:
+                    ends[-1] = end
+            else:
+                starts.append(start)
+                ends.append(end)
+        self._starts = starts
+        self._ends = ends
+
+    def _insert_range(self, start: int, end: int):
+        """Insert [start, end] into the used arrays, merging in place"""
+        starts, ends = self._starts, self._ends
+
+        # Ranges are already merged, so only the left neighbour can touch us
+        lo = bisect.bisect_left(starts, start)
+        if lo > 0 and ends[lo - 1] + 1 >= start:
+            lo -= 1
+            start = starts[lo]
+
+        # Everything from lo up to the first range starting past end + 1
+        # overlaps or is adjacent, and collapses into a single entry
+        hi = bisect.bisect_right(starts, end + 1)
+        if hi == lo:
+            starts.insert(lo, start)
+            ends.insert(lo, end)
             return
 
-        merged = []
-        for start, end in sorted(self.used_ranges):
-            if not merged:
-                merged.append([start, end])
-            elif merged[-1][1] + 1 >= start:  # Overlap or adjacent
-                merged[-1][1] = max(merged[-1][1], end)
-            else:
-                merged.append([start, end])
-        self.used_ranges = [(s[0], s[1]) for s in merged]
+        end = max(end, ends[hi - 1])
+        starts[lo] = start
+        ends[lo] = end
+        if hi > lo + 1:
+            del starts[lo + 1 : hi]
+            del ends[lo + 1 : hi]
 
     def is_available(self, cidr: str) -> bool:
         """Check if a CIDR is available (not overlapping)"""
         start, end = self._network_range(cidr)
 
-        for used_start, used_end in self.used_ranges:
-            # Check for any overlap
-            if not (end < used_start or start > used_end):
-                return False
-        return True
+        # Ranges are sorted and merged, so only the first range ending at or
+        # after `start` can overlap
+        idx = bisect.bisect_left(self._ends, start)
+        return idx == len(self._ends) or self._starts[idx] > end
 
     def find_best_fit(self, prefix_length: int) -> str | None:
         """
         Find the best-fit CIDR for the given prefix length.
-        Allocates from the center of the largest available gap.
+        Allocates from the center of the smallest gap that fits.
         """
-        required_size = 2 ** (32 - prefix_length)
-        parent_start = self._ip_to_int(str(self.parent_network.network_address))
-        parent_end = self._ip_to_int(str(self.parent_network.broadcast_address))
-
-        gaps: list[tuple[int, int, float]] = []
-
-        # If no used ranges, entire parent is available
-        if not self.used_ranges:
-            gap_start = parent_start
-            gap_end = parent_end
-            if gap_end - gap_start + 1 >= required_size:
-                gaps.append(
-                    (gap_start, gap_end, abs(gap_end - gap_start + 1 - required_size))
-                )
-        else:
-            # Gap before first range
-            if self.used_ranges[0][0] > parent_start + required_size - 1:
-                gap_start = parent_start
-                gap_end = min(parent_end, self.used_ranges[0][0] - 1)
-                if gap_end - gap_start + 1 >= required_size:
-                    gaps.append(
-                        (
-                            gap_start,
-                            gap_end,
-                            abs(gap_end - gap_start + 1 - required_size),
-                        )
-                    )
-
-            # Gaps between ranges
-            for i in range(len(self.used_ranges) - 1):
-                gap_start = self.used_ranges[i][1] + 1
-                gap_end = self.used_ranges[i + 1][0] - 1
-                if gap_end - gap_start + 1 >= required_size:
-                    gaps.append(
-                        (
-                            gap_start,
-                            gap_end,
-                            abs(gap_end - gap_start + 1 - required_size),
-                        )
-                    )
-
-            # Gap after last range
-            if self.used_ranges[-1][1] < parent_end - required_size + 1:
-                gap_start = self.used_ranges[-1][1] + 1
-                gap_end = parent_end
-                if gap_end - gap_start + 1 >= required_size:
-                    gaps.append(
-                        (
-                            gap_start,
-                            gap_end,
-                            abs(gap_end - gap_start + 1 - required_size),
-                        )
-                    )
-
-        if not gaps:
-            return None
-
-        # Find best gap (smallest waste = closest to required size)
-        best_gap = min(gaps, key=lambda x: x[2])
-        gap_start, gap_end, _ = best_gap
-        gap_size = gap_end - gap_start + 1
-
-        # Calculate allocation start, aligned to network boundary
-        mask = (0xFFFFFFFF << (32 - prefix_length)) & 0xFFFFFFFF
-
-        # Center of gap
-        gap_center = gap_start + (gap_size // 2)
-
-        # Align to network boundary
-        alloc_start = gap_center & mask
-
-        # Ensure it's within the gap and has enough space
-        if alloc_start < gap_start:
-            alloc_start = ((gap_start >> (32 - prefix_length)) + 1) << (
-                32 - prefix_length
-            )
-
-        alloc_end = alloc_start + required_size - 1
-        if alloc_end > gap_end:
-            alloc_start = ((gap_end - required_size + 1) >> (32 - prefix_length)) << (
-                32 - prefix_length
-            )
-            alloc_end = alloc_start + required_size - 1
-
-        # Final validation
-        if alloc_start < gap_start or alloc_end > gap_end:
+        alloc = _best_fit_core(
+            self._starts,
+            self._ends,
+            self.parent_start,
+            self.parent_end,
+            prefix_length,
+        )
+        if alloc is None:
             return None
 
-        alloc_cidr = f"{self._int_to_ip(alloc_start)}/{prefix_length}"
-
-        self.add_used_range(alloc_cidr)
-        return alloc_cidr
+        self._insert_range(*alloc)
+        return f"{_int_to_dotted(alloc[0])}/{prefix_length}"
 
 
 class AddressPoolAllocator(IPAllocator):
@@ -165,7 +228,7 @@ class AddressPoolAllocator(IPAllocator):
     Keyed by AddressPool name (not pool name).
     """
 
-    pass
+    __slots__ = ()
 
 
 class PoolAllocator(IPAllocator):
@@ -174,4 +237,4 @@ class PoolAllocator(IPAllocator):
     Keyed by Pool name (not subnet name).
     """
 
-    pass
+    __slots__ = ()
@@ -58,18 +58,15 @@ PyInstaller.__main__.run(
         "--onefile",  # Single EXE file
         "--name=" + OUTPUT_NAME,  # Output name
         f"--add-data={CONFIG_FILE}:.",  # Include config
+        # Dialects are loaded by URL at runtime, so name them explicitly;
+        # everything else is found by following ipam2.py's imports
         "--hidden-import=sqlalchemy.dialects.sqlite",
         "--hidden-import=sqlalchemy.dialects.postgresql",
         "--hidden-import=psycopg2",
-        "--hidden-import=rich",
         "--hidden-import=rich.console",
         "--hidden-import=rich.table",
-        "--hidden-import=rich.panel",
+        "--hidden-import=rich.tree",
         "--hidden-import=rich.box",
-        "--hidden-import=pandas",
-        "--collect-all=sqlalchemy",
-        "--collect-all=rich",
-        "--collect-all=pandas",
         "--collect-all=psycopg2",
         "--clean",  # Clean cache
         "--noconfirm",  # Overwrite output dir
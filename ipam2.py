@@ -6,35 +6,37 @@
 - Overlap prevention with proper allocator
 """
 
-import ipaddress
 import os
 import re
 import shutil
+from collections import defaultdict
 from datetime import datetime
+from functools import lru_cache
 from pathlib import Path
 
 import click
-import pandas as pd
-import sqlalchemy
 import yaml
-from rich import box
-from rich.console import Console
-from rich.panel import Panel
-from rich.table import Table
-from sqlalchemy.exc import IntegrityError
-from sqlalchemy.orm import sessionmaker
 
-from allocator import AddressPoolAllocator, PoolAllocator
-from models import AddressPool, Base, Pool, Subnet, Vpc
+from allocator import (
+    AddressPoolAllocator,
+    PoolAllocator,
+    num_addresses,
+    parse_cidr,
+    parse_network,
+)
+
+# Prefer the libyaml C loader when PyYAML was built with it
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeLoader
+
+# sqlalchemy, models, pandas and rich are imported where they are used, so
+# that commands such as --help and quickstart don't pay for them
 
-console = Console()
 db = None
 _config_file = None
 
-# XDG Config location for defaults
-XDG_CONFIG_HOME = os.environ.get("XDG_CONFIG_HOME", os.path.expanduser("~/.config"))
-IPAM2_CONFIG_FILE = Path(XDG_CONFIG_HOME) / "ipam2" / "config.yaml"
-
 # Default config location for standalone binary
 XDG_CONFIG_HOME = os.environ.get("XDG_CONFIG_HOME", os.path.expanduser("~/.config"))
 IPAM2_CONFIG_DIR = Path(XDG_CONFIG_HOME) / "ipam2"
@@ -44,14 +46,94 @@ IPAM2_DB_FILE = IPAM2_CONFIG_DIR / "ipam.db"
 # Legacy config location (current directory)
 LEGACY_CONFIG_FILE = Path("config.yaml")
 
-# Default config location for standalone binary
-XDG_CONFIG_HOME = os.environ.get("XDG_CONFIG_HOME", os.path.expanduser("~/.config"))
-IPAM2_CONFIG_DIR = Path(XDG_CONFIG_HOME) / "ipam2"
-IPAM2_CONFIG_FILE = IPAM2_CONFIG_DIR / "config.yaml"
-IPAM2_DB_FILE = IPAM2_CONFIG_DIR / "ipam.db"
 
-# Legacy config location (current directory)
-LEGACY_CONFIG_FILE = Path("config.yaml")
+@lru_cache(maxsize=1)
+def _resolve_config_path():
+    """Return the existing XDG or legacy config file, or None if neither exists"""
+    if IPAM2_CONFIG_FILE.exists():
+        return IPAM2_CONFIG_FILE
+    if LEGACY_CONFIG_FILE.exists():
+        return LEGACY_CONFIG_FILE
+    return None
+
+
+def _checkpoint_sqlite(db_file):
+    """
+    Fold the WAL back into the main SQLite file, so that copying the
+    file alone captures every committed change
+    """
+    import sqlite3
+
+    conn = sqlite3.connect(db_file)
+    try:
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    finally:
+        conn.close()
+
+
+def _upgrade_schema(engine):
+    """
+    Create missing tables, then add the columns and indexes that
+    create_all() does not add to tables that already exist.
+    """
+    from sqlalchemy import inspect, text
+
+    from models import AddressPool, Base, Pool, Subnet
+
+    Base.metadata.create_all(engine)
+
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for model in (AddressPool, Pool, Subnet):
+            table = model.__table__
+            columns = {c["name"] for c in inspector.get_columns(table.name)}
+            for column in (table.c.network_start, table.c.network_end):
+                if column.name not in columns:
+                    conn.execute(
+                        text(
+                            f"ALTER TABLE {table.name} ADD COLUMN {column.name} BIGINT"
+                        )
+                    )
+            indexes = {i["name"] for i in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name not in indexes:
+                    index.create(conn)
+
+
+def _backfill_network_bounds(engine):
+    """
+    Fill in network_start/network_end for rows that predate them, or that
+    were restored from a backup without them
+    """
+    from sqlalchemy.orm import Session
+
+    from models import AddressPool, Pool, Subnet, cidr_bounds
+
+    with Session(engine) as session:
+        for model in (AddressPool, Pool, Subnet):
+            rows = session.query(model).filter(model.network_start.is_(None)).all()
+            for row in rows:
+                try:
+                    row.network_start, row.network_end = cidr_bounds(row.cidr)
+                except ValueError as e:
+                    # Leave the row as it is rather than refuse to start
+                    click.echo(
+                        f"⚠️  Skipping {model.__tablename__} row '{row.name}' "
+                        f"with unparseable CIDR {row.cidr!r}: {e}",
+                        err=True,
+                    )
+        session.commit()
+
+
+def _record_schema_version(engine):
+    """Mark the database as migrated to the current SCHEMA_VERSION"""
+    from sqlalchemy.orm import Session
+
+    from models import SCHEMA_VERSION, SchemaInfo
+
+    with Session(engine) as session:
+        session.merge(SchemaInfo(id=1, version=SCHEMA_VERSION))
+        session.commit()
 
 
 class IPAMDatabase:
@@ -66,19 +148,18 @@ class IPAMDatabase:
         # Determine config file location
         if config_file:
             config_path = Path(config_file)
-        elif IPAM2_CONFIG_FILE.exists():
-            config_path = IPAM2_CONFIG_FILE
-        elif LEGACY_CONFIG_FILE.exists():
-            config_path = LEGACY_CONFIG_FILE
         else:
+            config_path = _resolve_config_path()
+        if config_path is None:
             # Create XDG config directory and default config
             IPAM2_CONFIG_DIR.mkdir(parents=True, exist_ok=True)
             self._create_default_config()
+            _resolve_config_path.cache_clear()
             config_path = IPAM2_CONFIG_FILE
 
         # Load config
         with open(config_path) as f:
-            config = yaml.safe_load(f)["database"]
+            config = yaml.load(f, Loader=SafeLoader)["database"]
 
         self.config = config
         self.config_file = str(config_path)
@@ -108,14 +189,98 @@ class IPAMDatabase:
 
         self.config = config
 
-        self.engine = sqlalchemy.create_engine(url)
-        Base.metadata.create_all(self.engine)
+        from sqlalchemy.orm import sessionmaker
+
+        from models import SCHEMA_VERSION
+
+        self.engine = self._create_engine(url)
         self.Session = sessionmaker(bind=self.engine)
+        # Up-to-date databases cost one query here; only new or older ones
+        # go through table creation, reflection and the endpoint backfill
+        if self._schema_version() < SCHEMA_VERSION:
+            self._migrate_schema()
+        self._prepare_statements()
 
         # Caches: keyed by name
         self._addr_pool_allocators = {}  # AddressPool name -> AddressPoolAllocator
         self._pool_allocators = {}  # Pool name -> PoolAllocator
 
+    @staticmethod
+    def _create_engine(url):
+        """
+        Create the engine with per-backend tuning:
+        SQLite runs in WAL mode with relaxed fsync, PostgreSQL gets a
+        pre-pinged connection pool
+        """
+        import sqlalchemy
+        from sqlalchemy import event
+        from sqlalchemy.pool import StaticPool
+
+        if url.startswith("sqlite"):
+            kwargs = {"connect_args": {"check_same_thread": False}}
+            if url in ("sqlite://", "sqlite:///:memory:"):
+                # One shared connection, or every checkout sees an empty DB
+                kwargs["poolclass"] = StaticPool
+            engine = sqlalchemy.create_engine(url, **kwargs)
+
+            @event.listens_for(engine, "connect")
+            def _set_sqlite_pragmas(dbapi_connection, connection_record):
+                cursor = dbapi_connection.cursor()
+                cursor.execute("PRAGMA journal_mode=WAL")
+                cursor.execute("PRAGMA synchronous=NORMAL")
+                cursor.execute("PRAGMA temp_store=MEMORY")
+                cursor.execute("PRAGMA mmap_size=268435456")
+                cursor.close()
+
+            return engine
+
+        if url.startswith("postgresql"):
+            return sqlalchemy.create_engine(
+                url, pool_size=10, max_overflow=20, pool_pre_ping=True
+            )
+
+        return sqlalchemy.create_engine(url)
+
+    def _schema_version(self) -> int:
+        """Schema version recorded in the database, 0 if there is none yet"""
+        from sqlalchemy import select
+        from sqlalchemy.exc import DBAPIError
+
+        from models import SchemaInfo
+
+        try:
+            with self.engine.connect() as conn:
+                return conn.scalar(select(SchemaInfo.version)) or 0
+        except DBAPIError:
+            # No schema_info table: a new database or one that predates it
+            return 0
+
+    def _migrate_schema(self):
+        """
+        Bring new databases and ones created by older versions up to date,
+        then record SCHEMA_VERSION so later runs skip all of this.
+        """
+        _upgrade_schema(self.engine)
+        _backfill_network_bounds(self.engine)
+        _record_schema_version(self.engine)
+
+    def _prepare_statements(self):
+        """
+        Build the statements used on the allocator build path once, with
+        bind parameters, so SQLAlchemy compiles each of them a single time
+        """
+        from sqlalchemy import bindparam, select
+
+        from models import Pool, Subnet
+
+        self._q_pool_by_name = select(Pool).where(Pool.name == bindparam("name"))
+        self._q_pool_cidrs_by_addr_pool = select(Pool.cidr).where(
+            Pool.address_pool_id == bindparam("address_pool_id")
+        )
+        self._q_subnet_cidrs_by_pool = select(Subnet.cidr).where(
+            Subnet.pool_id == bindparam("pool_id")
+        )
+
     def _create_default_config(self):
         """Create default config file in XDG location"""
         default_config = {
@@ -131,77 +296,189 @@ class IPAMDatabase:
     def session(self):
         return self.Session()
 
-    def get_addr_pool_allocator(self, addr_pool_name: str) -> AddressPoolAllocator:
+    def get_addr_pool_allocator(
+        self, addr_pool_name: str, session=None
+    ) -> AddressPoolAllocator:
         """
         Get or create allocator for an AddressPool.
-        ALWAYS rebuilds fresh to include ALL existing pools.
+        Built once from ALL existing pools, then cached by name until
+        invalidated. Reuses the caller's session when one is given.
         """
-        with self.session() as session:
-            addr_pool = (
-                session.query(AddressPool).filter_by(name=addr_pool_name).first()
-            )
-            if not addr_pool:
-                return None
+        allocator = self._addr_pool_allocators.get(addr_pool_name)
+        if allocator is not None:
+            return allocator
 
-            # Create fresh allocator with ALL existing pools
-            allocator = AddressPoolAllocator(addr_pool.cidr)
+        if session is None:
+            with self.session() as session:
+                return self._build_addr_pool_allocator(session, addr_pool_name)
+        return self._build_addr_pool_allocator(session, addr_pool_name)
 
-            # Add all existing pools in this address pool
-            for pool in addr_pool.pools:
-                allocator.add_used_range(pool.cidr)
+    def _build_addr_pool_allocator(
+        self, session, addr_pool_name: str
+    ) -> AddressPoolAllocator:
+        from models import AddressPool
 
-            return allocator
+        addr_pool = session.get(AddressPool, addr_pool_name)
+        if not addr_pool:
+            return None
+
+        # Create fresh allocator with ALL existing pools
+        allocator = AddressPoolAllocator(addr_pool.cidr)
 
-    def get_pool_allocator(self, pool_name: str) -> PoolAllocator:
+        # Add all existing pools in this address pool
+        allocator.bulk_load(
+            session.execute(
+                self._q_pool_cidrs_by_addr_pool, {"address_pool_id": addr_pool_name}
+            ).scalars()
+        )
+
+        self._addr_pool_allocators[addr_pool_name] = allocator
+        return allocator
+
+    def get_pool_allocator(self, pool_name: str, session=None) -> PoolAllocator:
         """
         Get or create allocator for a Pool.
-        ALWAYS rebuilds fresh to include ALL existing subnets.
+        Built once from ALL existing subnets, then cached by name until
+        invalidated. Reuses the caller's session when one is given.
         """
-        with self.session() as session:
-            pool = session.query(Pool).filter_by(name=pool_name).first()
-            if not pool:
-                return None
+        allocator = self._pool_allocators.get(pool_name)
+        if allocator is not None:
+            return allocator
 
-            # Create fresh allocator with ALL existing subnets
-            allocator = PoolAllocator(pool.cidr)
+        if session is None:
+            with self.session() as session:
+                return self._build_pool_allocator(session, pool_name)
+        return self._build_pool_allocator(session, pool_name)
 
-            # Add all existing subnets in this pool
-            for subnet in pool.subnets:
-                allocator.add_used_range(subnet.cidr)
+    def _build_pool_allocator(self, session, pool_name: str) -> PoolAllocator:
+        pool = session.execute(
+            self._q_pool_by_name, {"name": pool_name}
+        ).scalar_one_or_none()
+        if not pool:
+            return None
 
-            return allocator
+        # Create fresh allocator with ALL existing subnets
+        allocator = PoolAllocator(pool.cidr)
+
+        # Add all existing subnets in this pool
+        allocator.bulk_load(
+            session.execute(
+                self._q_subnet_cidrs_by_pool, {"pool_id": pool.id}
+            ).scalars()
+        )
 
-    def allocate_pool(self, addr_pool_name: str, prefix_length: int) -> str | None:
+        self._pool_allocators[pool_name] = allocator
+        return allocator
+
+    def invalidate_addr_pool_allocator(self, addr_pool_name: str):
+        """Drop the cached allocator for an AddressPool"""
+        self._addr_pool_allocators.pop(addr_pool_name, None)
+
+    def invalidate_pool_allocator(self, pool_name: str):
+        """Drop the cached allocator for a Pool"""
+        self._pool_allocators.pop(pool_name, None)
+
+    def invalidate_allocators(self):
+        """Drop all cached allocators"""
+        self._addr_pool_allocators.clear()
+        self._pool_allocators.clear()
+
+    def allocate_pool(
+        self, addr_pool_name: str, prefix_length: int, session=None
+    ) -> str | None:
         """Allocate a new pool from an address pool"""
-        allocator = self.get_addr_pool_allocator(addr_pool_name)
+        allocator = self.get_addr_pool_allocator(addr_pool_name, session=session)
         if not allocator:
             return None
 
         cidr = allocator.find_best_fit(prefix_length)
         return cidr
 
-    def allocate_subnet(self, pool_name: str, prefix_length: int) -> str | None:
+    def allocate_subnet(
+        self, pool_name: str, prefix_length: int, session=None
+    ) -> str | None:
         """Allocate a new subnet from a pool"""
-        allocator = self.get_pool_allocator(pool_name)
+        allocator = self.get_pool_allocator(pool_name, session=session)
         if not allocator:
             return None
 
         cidr = allocator.find_best_fit(prefix_length)
         return cidr
 
-    def is_pool_available(self, addr_pool_name: str, cidr: str) -> bool:
-        """Check if a CIDR is available in an address pool"""
-        allocator = self.get_addr_pool_allocator(addr_pool_name)
-        if not allocator:
+    def is_pool_available(self, addr_pool_name: str, cidr: str, session=None) -> bool:
+        """
+        Check if a CIDR is available in an address pool.
+        Answered by a cached allocator when there is one, otherwise by a
+        single overlap query, without building an allocator.
+        """
+        # parse_cidr() and the allocators' inet_aton() accept short forms
+        # like '10.1/16', so validate with IPv4Network first
+        parse_network(cidr)
+        allocator = self._addr_pool_allocators.get(addr_pool_name)
+        if allocator is not None:
+            return allocator.is_available(cidr)
+
+        if session is None:
+            with self.session() as session:
+                return self._pool_cidr_free(session, addr_pool_name, cidr)
+        return self._pool_cidr_free(session, addr_pool_name, cidr)
+
+    def _pool_cidr_free(self, session, addr_pool_name: str, cidr: str) -> bool:
+        from sqlalchemy import exists, select
+
+        from models import AddressPool, Pool
+
+        if session.get(AddressPool, addr_pool_name) is None:
             return False
-        return allocator.is_available(cidr)
 
-    def is_subnet_available(self, pool_name: str, cidr: str) -> bool:
-        """Check if a CIDR is available in a pool"""
-        allocator = self.get_pool_allocator(pool_name)
-        if not allocator:
+        start, end, _ = parse_cidr(cidr)
+        return not session.scalar(
+            select(
+                exists().where(
+                    Pool.address_pool_id == addr_pool_name,
+                    Pool.network_end >= start,
+                    Pool.network_start <= end,
+                )
+            )
+        )
+
+    def is_subnet_available(self, pool_name: str, cidr: str, session=None) -> bool:
+        """
+        Check if a CIDR is available in a pool.
+        Answered by a cached allocator when there is one, otherwise by a
+        single overlap query, without building an allocator.
+        """
+        # parse_cidr() and the allocators' inet_aton() accept short forms
+        # like '10.1/16', so validate with IPv4Network first
+        parse_network(cidr)
+        allocator = self._pool_allocators.get(pool_name)
+        if allocator is not None:
+            return allocator.is_available(cidr)
+
+        if session is None:
+            with self.session() as session:
+                return self._subnet_cidr_free(session, pool_name, cidr)
+        return self._subnet_cidr_free(session, pool_name, cidr)
+
+    def _subnet_cidr_free(self, session, pool_name: str, cidr: str) -> bool:
+        from sqlalchemy import exists, select
+
+        from models import Pool, Subnet
+
+        pool_id = session.scalar(select(Pool.id).where(Pool.name == pool_name))
+        if pool_id is None:
             return False
-        return allocator.is_available(cidr)
+
+        start, end, _ = parse_cidr(cidr)
+        return not session.scalar(
+            select(
+                exists().where(
+                    Subnet.pool_id == pool_id,
+                    Subnet.network_end >= start,
+                    Subnet.network_start <= end,
+                )
+            )
+        )
 
 
 @click.group(context_settings={"help_option_names": ["-h", "--help"]})
@@ -219,10 +496,16 @@ def cli(config_file):
     Name-based IDs | Hierarchical | No Overlaps
     AddressPool → Pool (smaller) → Subnet (smaller)
     """
-    global db, _config_file
+    global _config_file
     _config_file = config_file
+
+
+def _get_db() -> IPAMDatabase:
+    """Open the database on first use"""
+    global db
     if db is None:
-        db = IPAMDatabase(config_file=config_file)
+        db = IPAMDatabase(config_file=_config_file)
+    return db
 
 
 @cli.command()
@@ -252,9 +535,15 @@ def addresspool():
 @click.argument("cidr")
 def create(name, cidr):
     """Create a new address pool (/0-/32)"""
+    from sqlalchemy.exc import IntegrityError
+
+    from models import AddressPool
+
+    db = _get_db()
+
     # Validate CIDR
     try:
-        network = ipaddress.IPv4Network(cidr, strict=False)
+        network = parse_network(cidr)
         if network.prefixlen > 32:
             click.echo("❌ CIDR prefix must be /32 or smaller")
             return
@@ -276,31 +565,55 @@ def create(name, cidr):
 @addresspool.command(name="list")
 def list_pools():
     """List all address pools"""
+    from rich import box
+    from rich.console import Console
+    from rich.table import Table
+    from sqlalchemy import func, select
+
+    from models import AddressPool, Pool
+
+    db = _get_db()
+
     with db.session() as session:
-        pools = session.query(AddressPool).all()
-        if not pools:
+        # Counts come back with the rows: one statement for the whole listing
+        pool_count = (
+            select(func.count(Pool.id))
+            .where(Pool.address_pool_id == AddressPool.name)
+            .scalar_subquery()
+        )
+        rows = session.execute(
+            select(AddressPool.name, AddressPool.cidr, pool_count)
+        ).all()
+        if not rows:
             click.echo("No address pools found.")
             return
 
         table = Table("Name", "CIDR", "#Pools", box=box.ROUNDED)
-        for ap in pools:
-            count = session.query(Pool).filter_by(address_pool_id=ap.name).count()
-            table.add_row(ap.name, ap.cidr, str(count))
-        console.print(table)
+        for name, cidr, count in rows:
+            table.add_row(name, cidr, str(count))
+        Console().print(table)
 
 
 @addresspool.command()
 @click.argument("name")
 def delete(name):
     """Delete an address pool (and all its pools)"""
+    from sqlalchemy import func, select
+
+    from models import AddressPool, Pool
+
+    db = _get_db()
+
     with db.session() as session:
-        pool = session.query(AddressPool).filter_by(name=name).first()
+        pool = session.get(AddressPool, name)
         if not pool:
             click.echo(f"❌ AddressPool '{name}' not found")
             return
 
         # Check for existing pools
-        pool_count = session.query(Pool).filter_by(address_pool_id=name).count()
+        pool_count = session.scalar(
+            select(func.count()).select_from(Pool).where(Pool.address_pool_id == name)
+        )
         if pool_count > 0:
             click.echo(
                 f"❌ Cannot delete: {pool_count} pools exist in this address pool"
@@ -309,6 +622,7 @@ def delete(name):
 
         session.delete(pool)
         session.commit()
+        db.invalidate_addr_pool_allocator(name)
         click.echo(f"✅ Deleted AddressPool: {name}")
 
 
@@ -325,6 +639,12 @@ def vpc():
 @click.argument("name")
 def create(name):
     """Create a new VPC"""
+    from sqlalchemy.exc import IntegrityError
+
+    from models import Vpc
+
+    db = _get_db()
+
     with db.session() as session:
         try:
             vpc = Vpc(name=name)
@@ -339,32 +659,54 @@ def create(name):
 @vpc.command(name="list")
 def list_vpcs():
     """List all VPCs"""
+    from rich import box
+    from rich.console import Console
+    from rich.table import Table
+    from sqlalchemy import func, select
+
+    from models import Pool, Subnet, Vpc
+
+    db = _get_db()
+
     with db.session() as session:
-        vpcs = session.query(Vpc).all()
-        if not vpcs:
+        # Counts come back with the rows: one statement for the whole listing
+        pool_count = (
+            select(func.count(Pool.id)).where(Pool.vpc_id == Vpc.name).scalar_subquery()
+        )
+        subnet_count = (
+            select(func.count(Subnet.id))
+            .where(Subnet.vpc_id == Vpc.name)
+            .scalar_subquery()
+        )
+        rows = session.execute(select(Vpc.name, pool_count, subnet_count)).all()
+        if not rows:
             click.echo("No VPCs found.")
             return
 
         table = Table("Name", "#Pools", "#Subnets", box=box.ROUNDED)
-        for v in vpcs:
-            pool_count = session.query(Pool).filter_by(vpc_id=v.name).count()
-            subnet_count = session.query(Subnet).filter_by(vpc_id=v.name).count()
-            table.add_row(v.name, str(pool_count), str(subnet_count))
-        console.print(table)
+        for name, n_pools, n_subnets in rows:
+            table.add_row(name, str(n_pools), str(n_subnets))
+        Console().print(table)
 
 
 @vpc.command()
 @click.argument("name")
 def delete(name):
     """Delete a VPC (and all its pools/subnets)"""
+    from models import Vpc
+
+    db = _get_db()
+
     with db.session() as session:
-        vpc = session.query(Vpc).filter_by(name=name).first()
+        vpc = session.get(Vpc, name)
         if not vpc:
             click.echo(f"❌ VPC '{name}' not found")
             return
 
         session.delete(vpc)
         session.commit()
+        # Cascade removes pools/subnets across address pools
+        db.invalidate_allocators()
         click.echo(f"✅ Deleted VPC: {name}")
 
 
@@ -389,6 +731,12 @@ def pool():
 @click.argument("vpc_name")
 def create(name, address_pool_name, vpc_name, prefix):
     """Create a new pool within an address pool and VPC (/0-/32)"""
+    from sqlalchemy.exc import IntegrityError
+
+    from models import AddressPool, Pool, Vpc
+
+    db = _get_db()
+
     # Validate prefix
     if prefix < 0 or prefix > 32:
         click.echo("❌ Pool prefix must be /0-/32")
@@ -396,22 +744,22 @@ def create(name, address_pool_name, vpc_name, prefix):
 
     with db.session() as session:
         # Check if address pool exists
-        addr_pool = session.query(AddressPool).filter_by(name=address_pool_name).first()
+        addr_pool = session.get(AddressPool, address_pool_name)
         if not addr_pool:
             click.echo(f"❌ AddressPool '{address_pool_name}' not found")
             return
 
         # Validate pool is smaller than address pool
-        addr_pool_network = ipaddress.IPv4Network(addr_pool.cidr, strict=False)
-        if prefix <= addr_pool_network.prefixlen:
+        _, _, addr_pool_prefix = parse_cidr(addr_pool.cidr)
+        if prefix <= addr_pool_prefix:
             click.echo(
                 f"❌ Pool prefix ({prefix}) must be smaller than "
-                f"AddressPool ({addr_pool_network.prefixlen})"
+                f"AddressPool ({addr_pool_prefix})"
             )
             return
 
         # Check if VPC exists
-        vpc = session.query(Vpc).filter_by(name=vpc_name).first()
+        vpc = session.get(Vpc, vpc_name)
         if not vpc:
             click.echo(f"❌ VPC '{vpc_name}' not found")
             return
@@ -429,7 +777,7 @@ def create(name, address_pool_name, vpc_name, prefix):
             return
 
         # Allocate from address pool
-        cidr = db.allocate_pool(address_pool_name, prefix)
+        cidr = db.allocate_pool(address_pool_name, prefix, session=session)
 
         if not cidr:
             click.echo(f"❌ No space available in {address_pool_name}")
@@ -444,39 +792,163 @@ def create(name, address_pool_name, vpc_name, prefix):
             click.echo(f"✅ Created Pool: {name} | {cidr}")
         except IntegrityError:
             session.rollback()
+            # The allocator already reserved the CIDR
+            db.invalidate_addr_pool_allocator(address_pool_name)
             click.echo(f"❌ Pool '{name}' already exists")
 
 
+@pool.command()
+@click.argument("address_pool_name")
+@click.argument("vpc_name")
+@click.argument("names", nargs=-1, required=True)
+@click.option(
+    "--prefix",
+    "-p",
+    default=24,
+    help="CIDR prefix (/0-/32, must be smaller than AddressPool)",
+)
+def bulk(address_pool_name, vpc_name, names, prefix):
+    """Create several pools of the same size in one transaction
+
+    Example:
+        ipam2 pool bulk main prod web app db --prefix 24
+    """
+    from sqlalchemy.exc import IntegrityError
+
+    from models import AddressPool, Pool, Vpc
+
+    db = _get_db()
+
+    # Validate prefix
+    if prefix < 0 or prefix > 32:
+        click.echo("❌ Pool prefix must be /0-/32")
+        return
+
+    if len(set(names)) != len(names):
+        click.echo("❌ Pool names must be unique")
+        return
+
+    with db.session() as session:
+        # Check if address pool exists
+        addr_pool = session.get(AddressPool, address_pool_name)
+        if not addr_pool:
+            click.echo(f"❌ AddressPool '{address_pool_name}' not found")
+            return
+
+        # Validate pools are smaller than address pool
+        _, _, addr_pool_prefix = parse_cidr(addr_pool.cidr)
+        if prefix <= addr_pool_prefix:
+            click.echo(
+                f"❌ Pool prefix ({prefix}) must be smaller than "
+                f"AddressPool ({addr_pool_prefix})"
+            )
+            return
+
+        # Check if VPC exists
+        vpc = session.get(Vpc, vpc_name)
+        if not vpc:
+            click.echo(f"❌ VPC '{vpc_name}' not found")
+            return
+
+        # Check all names in one query
+        existing = session.query(Pool.name).filter(Pool.name.in_(names)).all()
+        if existing:
+            taken = ", ".join(n for (n,) in existing)
+            click.echo(f"❌ Pools already exist: {taken}")
+            return
+
+        # Allocate everything in memory from one allocator
+        allocator = db.get_addr_pool_allocator(address_pool_name, session=session)
+        # (name, cidr) kept apart: the ORM objects are expired after commit
+        allocated = []
+        pools = []
+        for name in names:
+            cidr = allocator.find_best_fit(prefix)
+            if not cidr:
+                # Nothing is written; forget the CIDRs reserved so far
+                db.invalidate_addr_pool_allocator(address_pool_name)
+                click.echo(
+                    f"❌ No space available in {address_pool_name} "
+                    f"for '{name}' ({len(allocated)}/{len(names)} allocated)"
+                )
+                return
+            allocated.append((name, cidr))
+            pools.append(
+                Pool(
+                    name=name,
+                    cidr=cidr,
+                    address_pool_id=address_pool_name,
+                    vpc_id=vpc_name,
+                )
+            )
+
+        try:
+            session.add_all(pools)
+            session.commit()
+        except IntegrityError:
+            session.rollback()
+            # The allocator already reserved the CIDRs
+            db.invalidate_addr_pool_allocator(address_pool_name)
+            click.echo("❌ Pool names already exist")
+            return
+
+        for name, cidr in allocated:
+            click.echo(f"✅ Created Pool: {name} | {cidr}")
+
+
 @pool.command(name="list")
 def list_pools():
     """List all pools"""
+    from rich import box
+    from rich.console import Console
+    from rich.table import Table
+    from sqlalchemy import func, select
+
+    from models import Pool, Subnet
+
+    db = _get_db()
+
     with db.session() as session:
-        pools = session.query(Pool).all()
-        if not pools:
+        # Counts come back with the rows: one statement for the whole listing
+        subnet_count = (
+            select(func.count(Subnet.id))
+            .where(Subnet.pool_id == Pool.id)
+            .scalar_subquery()
+        )
+        rows = session.execute(
+            select(
+                Pool.name, Pool.cidr, Pool.address_pool_id, Pool.vpc_id, subnet_count
+            )
+        ).all()
+        if not rows:
             click.echo("No pools found.")
             return
 
         table = Table("Name", "CIDR", "AddressPool", "VPC", "#Subnets", box=box.ROUNDED)
-        for p in pools:
-            subnet_count = session.query(Subnet).filter_by(pool_id=p.id).count()
-            table.add_row(
-                p.name, p.cidr, p.address_pool_id, p.vpc_id, str(subnet_count)
-            )
-        console.print(table)
+        for name, cidr, addr_pool_name, vpc_name, count in rows:
+            table.add_row(name, cidr, addr_pool_name, vpc_name, str(count))
+        Console().print(table)
 
 
 @pool.command()
 @click.argument("name")
 def delete(name):
     """Delete a pool (and all its subnets)"""
+    from models import Pool
+
+    db = _get_db()
+
     with db.session() as session:
         pool = session.query(Pool).filter_by(name=name).first()
         if not pool:
             click.echo(f"❌ Pool '{name}' not found")
             return
 
+        address_pool_name = pool.address_pool_id
         session.delete(pool)
         session.commit()
+        db.invalidate_addr_pool_allocator(address_pool_name)
+        db.invalidate_pool_allocator(name)
         click.echo(f"✅ Deleted Pool: {name}")
 
 
@@ -501,6 +973,12 @@ def subnet():
 @click.argument("vpc_name")
 def create(name, pool_name, vpc_name, prefix):
     """Create a new subnet within a pool and VPC (/0-/32)"""
+    from sqlalchemy.exc import IntegrityError
+
+    from models import Pool, Subnet, Vpc
+
+    db = _get_db()
+
     # Validate prefix
     if prefix < 0 or prefix > 32:
         click.echo("❌ Subnet prefix must be /0-/32")
@@ -514,16 +992,15 @@ def create(name, pool_name, vpc_name, prefix):
             return
 
         # Validate subnet is smaller than pool
-        pool_network = ipaddress.IPv4Network(pool.cidr, strict=False)
-        if prefix <= pool_network.prefixlen:
+        _, _, pool_prefix = parse_cidr(pool.cidr)
+        if prefix <= pool_prefix:
             click.echo(
-                f"❌ Subnet prefix ({prefix}) must be smaller than "
-                f"Pool ({pool_network.prefixlen})"
+                f"❌ Subnet prefix ({prefix}) must be smaller than Pool ({pool_prefix})"
             )
             return
 
         # Check if VPC exists
-        vpc = session.query(Vpc).filter_by(name=vpc_name).first()
+        vpc = session.get(Vpc, vpc_name)
         if not vpc:
             click.echo(f"❌ VPC '{vpc_name}' not found")
             return
@@ -542,7 +1019,7 @@ def create(name, pool_name, vpc_name, prefix):
             return
 
         # Allocate from pool
-        cidr = db.allocate_subnet(pool_name, prefix)
+        cidr = db.allocate_subnet(pool_name, prefix, session=session)
 
         if not cidr:
             click.echo(f"❌ No space available in {pool_name}")
@@ -555,41 +1032,172 @@ def create(name, pool_name, vpc_name, prefix):
             click.echo(f"✅ Created Subnet: {name} | {cidr}")
         except IntegrityError:
             session.rollback()
+            # The allocator already reserved the CIDR
+            db.invalidate_pool_allocator(pool_name)
             click.echo(f"❌ Subnet '{name}' already exists")
 
 
+@subnet.command()
+@click.argument("pool_name")
+@click.argument("vpc_name")
+@click.argument("names", nargs=-1, required=True)
+@click.option(
+    "--prefix",
+    "-p",
+    default=27,
+    help="CIDR prefix (/0-/32, must be smaller than Pool)",
+)
+def bulk(pool_name, vpc_name, names, prefix):
+    """Create several subnets of the same size in one transaction
+
+    Example:
+        ipam2 subnet bulk web prod frontend backend cache --prefix 27
+    """
+    from sqlalchemy.exc import IntegrityError
+
+    from models import Pool, Subnet, Vpc
+
+    db = _get_db()
+
+    # Validate prefix
+    if prefix < 0 or prefix > 32:
+        click.echo("❌ Subnet prefix must be /0-/32")
+        return
+
+    if len(set(names)) != len(names):
+        click.echo("❌ Subnet names must be unique")
+        return
+
+    with db.session() as session:
+        # Check if pool exists
+        pool = session.query(Pool).filter_by(name=pool_name).first()
+        if not pool:
+            click.echo(f"❌ Pool '{pool_name}' not found")
+            return
+
+        # Validate subnets are smaller than pool
+        _, _, pool_prefix = parse_cidr(pool.cidr)
+        if prefix <= pool_prefix:
+            click.echo(
+                f"❌ Subnet prefix ({prefix}) must be smaller than Pool ({pool_prefix})"
+            )
+            return
+
+        # Check if VPC exists
+        vpc = session.get(Vpc, vpc_name)
+        if not vpc:
+            click.echo(f"❌ VPC '{vpc_name}' not found")
+            return
+
+        # Verify VPC matches pool's VPC
+        if pool.vpc_id != vpc_name:
+            click.echo(
+                f"❌ VPC mismatch: Pool belongs to '{pool.vpc_id}', not '{vpc_name}'"
+            )
+            return
+
+        # Check all names in this pool in one query
+        existing = (
+            session.query(Subnet.name)
+            .filter(Subnet.pool_id == pool.id, Subnet.name.in_(names))
+            .all()
+        )
+        if existing:
+            taken = ", ".join(n for (n,) in existing)
+            click.echo(f"❌ Subnets already exist in Pool '{pool_name}': {taken}")
+            return
+
+        # Allocate everything in memory from one allocator
+        allocator = db.get_pool_allocator(pool_name, session=session)
+        # (name, cidr) kept apart: the ORM objects are expired after commit
+        allocated = []
+        subnets = []
+        for name in names:
+            cidr = allocator.find_best_fit(prefix)
+            if not cidr:
+                # Nothing is written; forget the CIDRs reserved so far
+                db.invalidate_pool_allocator(pool_name)
+                click.echo(
+                    f"❌ No space available in {pool_name} "
+                    f"for '{name}' ({len(allocated)}/{len(names)} allocated)"
+                )
+                return
+            allocated.append((name, cidr))
+            subnets.append(
+                Subnet(name=name, cidr=cidr, pool_id=pool.id, vpc_id=vpc_name)
+            )
+
+        try:
+            session.add_all(subnets)
+            session.commit()
+        except IntegrityError:
+            session.rollback()
+            # The allocator already reserved the CIDRs
+            db.invalidate_pool_allocator(pool_name)
+            click.echo("❌ Subnet names already exist")
+            return
+
+        for name, cidr in allocated:
+            click.echo(f"✅ Created Subnet: {name} | {cidr}")
+
+
 @subnet.command(name="list")
 def list_subnets():
     """List all subnets"""
+    from rich import box
+    from rich.console import Console
+    from rich.table import Table
+    from sqlalchemy import select
+
+    from models import Pool, Subnet
+
+    db = _get_db()
+
     with db.session() as session:
-        subnets = session.query(Subnet).all()
-        if not subnets:
-            click.echo("No subnets found.")
-            return
+        # Pool names come from the join, not from a lazy load per subnet;
+        # rows are streamed in batches rather than fetched all at once
+        rows = session.execute(
+            select(Subnet.name, Subnet.cidr, Pool.name, Subnet.vpc_id).outerjoin(
+                Pool, Subnet.pool_id == Pool.id
+            )
+        ).yield_per(1000)
 
         table = Table("Name", "CIDR", "Pool", "VPC", box=box.ROUNDED)
-        for s in subnets:
-            table.add_row(s.name, s.cidr, s.pool.name if s.pool else "?", s.vpc_id)
-        console.print(table)
+        for name, cidr, pool_name, vpc_name in rows:
+            table.add_row(name, cidr, pool_name or "?", vpc_name)
+        if not table.row_count:
+            click.echo("No subnets found.")
+            return
+        Console().print(table)
 
 
 @subnet.command()
 @click.argument("name")
 def delete(name):
     """Delete a subnet"""
+    from models import Subnet
+
+    db = _get_db()
+
     with db.session() as session:
         subnet = session.query(Subnet).filter_by(name=name).first()
         if not subnet:
             click.echo(f"❌ Subnet '{name}' not found")
             return
 
+        pool_name = subnet.pool.name if subnet.pool else None
         session.delete(subnet)
         session.commit()
+        if pool_name:
+            db.invalidate_pool_allocator(pool_name)
         click.echo(f"✅ Deleted Subnet: {name}")
 
 
 # ============ REPORTS ============
 
+# Utilization bars, one per 5% step, indexed by min(int(util / 5), 20)
+_BARS = ["█" * i + "░" * (20 - i) for i in range(21)]
+
 
 @cli.group()
 def report():
@@ -600,78 +1208,94 @@ def report():
 @report.command()
 def tui():
     """Show utilization report"""
+    from rich.console import Console
+    from rich.tree import Tree
+    from sqlalchemy import select
+
+    from models import AddressPool, Pool, Subnet
+
+    db = _get_db()
+
     with db.session() as session:
-        aps = session.query(AddressPool).all()
-        console.print(Panel("🏢 IPAM Utilization Report", style="bold cyan"))
-
-        for ap in aps:
-            # Calculate AddressPool utilization
-            network = ipaddress.IPv4Network(ap.cidr, strict=False)
-            total_slots = 2 ** (24 - network.prefixlen)  # e.g., /16 -> 2^8 = 256 slots
-
-            pools = session.query(Pool).filter_by(address_pool_id=ap.name).all()
-            pool_count = len(pools)
-            util = (pool_count / total_slots) * 100 if total_slots > 0 else 0
-            bar = "█" * min(int(util / 5), 20) + "░" * max(20 - int(util / 5), 0)
-
-            console.print(f"\n📦 AddressPool: {ap.name} ({ap.cidr})")
-            console.print(
-                f"   Utilization: {pool_count}/{total_slots} pools {bar} {util:.1f}%"
+        # Three flat column queries, stitched together here: the report only
+        # reads names and CIDRs, so no ORM objects are built
+        aps = session.execute(select(AddressPool.name, AddressPool.cidr)).all()
+
+        pools_by_ap = defaultdict(list)
+        for pool_id, name, cidr, addr_pool_name, vpc_name in session.execute(
+            select(
+                Pool.id, Pool.name, Pool.cidr, Pool.address_pool_id, Pool.vpc_id
+            ).order_by(Pool.id)
+        ).yield_per(1000):
+            pools_by_ap[addr_pool_name].append((pool_id, name, cidr, vpc_name))
+
+        subnets_by_pool = defaultdict(list)
+        for pool_id, name, cidr in session.execute(
+            select(Subnet.pool_id, Subnet.name, Subnet.cidr).order_by(Subnet.id)
+        ).yield_per(1000):
+            subnets_by_pool[pool_id].append((name, cidr))
+
+    # The whole report is built as one tree and rendered in a single print
+    report_tree = Tree("[bold cyan]🏢 IPAM Utilization Report[/]")
+
+    for ap_name, ap_cidr in aps:
+        # Calculate AddressPool utilization
+        _, _, ap_prefix = parse_cidr(ap_cidr)
+        pools = pools_by_ap.get(ap_name, [])
+
+        # Slots are sized by the largest pool actually carved out of this
+        # AddressPool (e.g., /12 with /20 pools -> 2^8 = 256 slots); /24 is
+        # assumed until the first pool exists
+        child_prefix = min(
+            (parse_cidr(cidr)[2] for _, _, cidr, _ in pools),
+            default=max(ap_prefix, 24),
+        )
+        total_slots = 1 << (child_prefix - ap_prefix)
+        pool_count = len(pools)
+        util = (pool_count / total_slots) * 100 if total_slots > 0 else 0
+        bar = _BARS[min(int(util / 5), 20)]
+
+        ap_node = report_tree.add(
+            f"📦 AddressPool: {ap_name} ({ap_cidr})\n"
+            f"Utilization: {pool_count}/{total_slots} pools {bar} {util:.1f}%"
+        )
+        if not pools:
+            ap_node.add("(no pools)")
+            continue
+
+        # Group pools by VPC, counting subnets on the way
+        vpc_pools = defaultdict(list)
+        vpc_subnet_counts = defaultdict(int)
+        for p in pools:
+            pool_id, _, _, vpc_name = p
+            vpc_pools[vpc_name].append(p)
+            vpc_subnet_counts[vpc_name] += len(subnets_by_pool.get(pool_id, ()))
+
+        # Show each VPC
+        for vpc_name, vpc_pools_list in vpc_pools.items():
+            vpc_node = ap_node.add(
+                f"🌐 VPC: {vpc_name}\n"
+                f"Pools: {len(vpc_pools_list)} | Subnets: {vpc_subnet_counts[vpc_name]}"
             )
 
-            # Group pools by VPC
-            vpc_pools = {}
-            for p in pools:
-                if p.vpc_id not in vpc_pools:
-                    vpc_pools[p.vpc_id] = []
-                vpc_pools[p.vpc_id].append(p)
-
-            # Show each VPC
-            for vpc_name, vpc_pools_list in vpc_pools.items():
-                vpc_subnet_count = sum(
-                    session.query(Subnet).filter_by(pool_id=p.id).count()
-                    for p in vpc_pools_list
-                )
-                console.print(f"\n   🌐 VPC: {vpc_name}")
-                console.print(
-                    f"      Pools: {len(vpc_pools_list)} | Subnets: {vpc_subnet_count}"
+            # Show pools in this VPC
+            for pool_id, pool_name, pool_cidr, _ in vpc_pools_list:
+                pool_size = num_addresses(pool_cidr)
+                subnets = subnets_by_pool.get(pool_id, [])
+                used_ips = sum(num_addresses(cidr) for _, cidr in subnets)
+                util_percent = (used_ips / pool_size) * 100 if pool_size > 0 else 0
+                pool_bar = _BARS[min(int(util_percent / 5), 20)]
+
+                pool_node = vpc_node.add(
+                    f"📦 {pool_name} ({pool_cidr})\n"
+                    f"Used: {used_ips}/{pool_size} IPs {pool_bar} {util_percent:.1f}%"
                 )
 
-                # Show pools in this VPC
-                for i, p in enumerate(vpc_pools_list):
-                    net = ipaddress.IPv4Network(p.cidr, strict=False)
-                    pool_size = net.num_addresses
-                    subnets = session.query(Subnet).filter_by(pool_id=p.id).all()
-                    subnet_count = len(subnets)
-                    used_ips = sum(
-                        ipaddress.IPv4Network(s.cidr, strict=False).num_addresses
-                        for s in subnets
-                    )
-                    util_percent = (used_ips / pool_size) * 100 if pool_size > 0 else 0
-                    pool_bar = "█" * min(int(util_percent / 5), 20) + "░" * max(
-                        20 - int(util_percent / 5), 0
-                    )
+                # Show subnets in this pool
+                for subnet_name, subnet_cidr in subnets:
+                    pool_node.add(f"🔢 {subnet_name} ({subnet_cidr})")
 
-                    # Tree characters
-                    is_last_pool = i == len(vpc_pools_list) - 1
-                    pool_prefix = "   └──" if is_last_pool else "   ├──"
-                    pool_connector = "       " if is_last_pool else "   │   "
-
-                    console.print(f"{pool_prefix} 📦 {p.name} ({p.cidr})")
-                    util_str = f"{util_percent:.1f}%"
-                    used_msg = f"Used: {used_ips}/{pool_size} IPs {pool_bar} {util_str}"
-                    console.print(f"{pool_connector} {used_msg}")
-
-                    # Show subnets in this pool
-                    for j, s in enumerate(subnets):
-                        is_last_subnet = j == len(subnets) - 1
-                        subnet_prefix = pool_connector + (
-                            "   └──" if is_last_subnet else "   ├──"
-                        )
-                        console.print(f"{subnet_prefix} 🔢 {s.name} ({s.cidr})")
-
-            if not pools:
-                console.print("   (no pools)")
+    Console().print(report_tree)
 
 
 # ============ BACKUP ============
@@ -686,25 +1310,15 @@ def backup():
 @backup.command()
 def create():
     """Create a timestamped backup (always in SQLite format for portability)"""
+    import sqlalchemy
+
+    db = _get_db()
+
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
     backup_file = f"ipam_{timestamp}.db"
 
     # Get current database URL
-    if hasattr(db, 'config'):
-        db_url = db.config.get("sqlite_url") or db.config.get("postgres_url")
-    else:
-        # Fallback to config file
-        if IPAM2_CONFIG_FILE.exists():
-            config_path = IPAM2_CONFIG_FILE
-        elif LEGACY_CONFIG_FILE.exists():
-            config_path = LEGACY_CONFIG_FILE
-        else:
-            click.echo("❌ No config file found")
-            return
-
-        with open(config_path) as f:
-            config = yaml.safe_load(f)["database"]
-        db_url = config.get("sqlite_url") or config.get("postgres_url")
+    db_url = db.config.get("sqlite_url") or db.config.get("postgres_url")
 
     if db_url is None:
         click.echo("❌ No database URL found in config")
@@ -716,8 +1330,8 @@ def create():
         if db_file and db_file != ":memory:" and os.path.exists(db_file):
             try:
                 # Close existing connections first
-                if hasattr(db, 'engine') and db.engine:
-                    db.engine.dispose()
+                db.engine.dispose()
+                _checkpoint_sqlite(db_file)
 
                 shutil.copy(db_file, backup_file)
                 click.echo(f"✅ Backup: {backup_file} (SQLite)")
@@ -735,6 +1349,8 @@ def create():
                 user, password, host, port, dbname = match.groups()
                 port = port or '5432'
 
+                import pandas as pd
+
                 click.echo("📦 Exporting PostgreSQL data to SQLite...")
 
                 # Create source engine
@@ -789,6 +1405,10 @@ def restore(backup_file, target, postgres_url):
         ipam2 restore backup.db --target sqlite    # Restore to SQLite
         ipam2 restore backup.db --target postgres  # Restore to PostgreSQL
     """
+    import sqlalchemy
+
+    db = _get_db()
+
     backup_path = Path(backup_file)
 
     # Verify backup file
@@ -804,30 +1424,22 @@ def restore(backup_file, target, postgres_url):
         target_type = "PostgreSQL"
     elif target == "sqlite":
         # Get SQLite URL from config
-        if hasattr(db, 'config'):
-            sqlite_url = db.config.get("sqlite_url")
-            postgres_url = db.config.get("postgres_url")
-            # If current config is postgres, use default XDG location
-            if postgres_url:
-                sqlite_url = f"sqlite:///{IPAM2_DB_FILE}"
-        else:
+        sqlite_url = db.config.get("sqlite_url")
+        postgres_url = db.config.get("postgres_url")
+        # If current config is postgres, use default XDG location
+        if postgres_url:
             sqlite_url = f"sqlite:///{IPAM2_DB_FILE}"
         target_url = sqlite_url
         target_type = "SQLite"
     else:
         # Auto-detect from current config
-        if hasattr(db, 'config'):
-            sqlite_url = db.config.get("sqlite_url")
-            postgres_url = db.config.get("postgres_url")
-            if postgres_url:
-                target_url = postgres_url
-                target_type = "PostgreSQL"
-            else:
-                target_url = sqlite_url
-                target_type = "SQLite"
+        sqlite_url = db.config.get("sqlite_url")
+        postgres_url = db.config.get("postgres_url")
+        if postgres_url:
+            target_url = postgres_url
+            target_type = "PostgreSQL"
         else:
-            # Default to SQLite
-            target_url = f"sqlite:///{IPAM2_DB_FILE}"
+            target_url = sqlite_url
             target_type = "SQLite"
 
     click.echo(f"🔄 Restoring {backup_file} → {target_type}")
@@ -849,17 +1461,24 @@ def restore(backup_file, target, postgres_url):
             if target_db_file and target_db_file != ":memory:":
                 try:
                     # Close existing connections
-                    if hasattr(db, 'engine') and db.engine:
-                        db.engine.dispose()
+                    db.engine.dispose()
 
                     # Backup current database first
                     if os.path.exists(target_db_file):
+                        _checkpoint_sqlite(target_db_file)
                         current_backup = f"{target_db_file}.pre_restore_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
                         shutil.copy(target_db_file, current_backup)
                         click.echo(f"💾 Current database backed up to: {current_backup}")
 
-                    # Copy backup to target
+                    # Copy backup to target, then bring it up to the
+                    # current schema (older backups lack the endpoints)
                     shutil.copy(backup_path, target_db_file)
+                    restored_engine = sqlalchemy.create_engine(target_url)
+                    _upgrade_schema(restored_engine)
+                    _backfill_network_bounds(restored_engine)
+                    _record_schema_version(restored_engine)
+                    restored_engine.dispose()
+                    db.invalidate_allocators()
                     click.echo(f"✅ Restored from: {backup_path}")
                     click.echo(f"   Target: {target_db_file}")
                     return
@@ -875,6 +1494,7 @@ def restore(backup_file, target, postgres_url):
                 port = port or '5432'
 
                 target_engine = sqlalchemy.create_engine(target_url)
+                _upgrade_schema(target_engine)
 
                 # Truncate tables with CASCADE to handle foreign key dependencies
                 try:
@@ -917,8 +1537,12 @@ def restore(backup_file, target, postgres_url):
                 except Exception as e:
                     click.echo(f"   ⚠️  Constraints: {e}")
 
+                # Older backups carry no network_start/network_end values
+                _backfill_network_bounds(target_engine)
+
                 target_engine.dispose()
                 source_engine.dispose()
+                db.invalidate_allocators()
 
                 click.echo(f"✅ Restored from: {backup_path}")
                 click.echo(f"   Target: postgresql://{host}:{port}/{dbname}")
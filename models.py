@@ -3,14 +3,31 @@ SQLAlchemy ORM Models for IPAM
 Using name as unique identifier (no UUIDs)
 """
 
-import ipaddress
-
-from sqlalchemy import Column, ForeignKey, Integer, String, UniqueConstraint
+from sqlalchemy import (
+    BigInteger,
+    Column,
+    ForeignKey,
+    Index,
+    Integer,
+    String,
+    UniqueConstraint,
+)
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import relationship, validates
+
+from allocator import parse_cidr, parse_network
 
 Base = declarative_base()
 
+# Bump whenever the schema changes in a way IPAMDatabase._migrate_schema
+# has to bring older databases up to
+SCHEMA_VERSION = 3
+
+
+def cidr_bounds(cidr):
+    """Get (start, end) integer range for a CIDR"""
+    return parse_cidr(cidr)[:2]
+
 
 class AddressPool(Base):
     """Top-level address pool (/8 to /16) - e.g., 10.0.0.0/16"""
@@ -20,6 +37,10 @@ class AddressPool(Base):
     name = Column(String(100), primary_key=True)
     cidr = Column(String(18), nullable=False)
 
+    # Integer endpoints of cidr, kept in sync by _set_network_bounds
+    network_start = Column(BigInteger, index=True)
+    network_end = Column(BigInteger, index=True)
+
     # Relationships
     pools = relationship(
         "Pool", back_populates="address_pool", cascade="all, delete-orphan"
@@ -28,13 +49,25 @@ class AddressPool(Base):
     def __repr__(self):
         return f"<AddressPool {self.name}: {self.cidr}>"
 
+    # Parsed network, built on first access and dropped when cidr changes
+    _network = None
+
     @property
     def network(self):
-        return ipaddress.IPv4Network(self.cidr, strict=False)
+        if self._network is None:
+            self._network = parse_network(self.cidr)
+        return self._network
+
+    @validates("cidr")
+    def _set_network_bounds(self, key, cidr):
+        self.network_start, self.network_end = cidr_bounds(cidr)
+        self._network = None
+        return cidr
 
     def contains(self, cidr):
         """Check if a CIDR is within this pool"""
-        return ipaddress.IPv4Network(cidr, strict=False).subnet_of(self.network)
+        start, end = cidr_bounds(cidr)
+        return self.network_start <= start and end <= self.network_end
 
 
 class Vpc(Base):
@@ -56,17 +89,25 @@ class Pool(Base):
     """Mid-level pool (/22 to /30) - child of AddressPool"""
 
     __tablename__ = "pools"
-    __table_args__ = (UniqueConstraint("name", name="uq_pool_name"),)
+    __table_args__ = (
+        UniqueConstraint("name", name="uq_pool_name"),
+        # Also serves lookups on address_pool_id alone
+        Index("ix_pool_addrpool_vpc", "address_pool_id", "vpc_id"),
+    )
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     name = Column(String(100), nullable=False, unique=True)
     cidr = Column(String(18), nullable=False)
 
+    # Integer endpoints of cidr, kept in sync by _set_network_bounds
+    network_start = Column(BigInteger, index=True)
+    network_end = Column(BigInteger, index=True)
+
     # Foreign keys
     address_pool_id = Column(
         String(100), ForeignKey("address_pools.name"), nullable=False
     )
-    vpc_id = Column(String(100), ForeignKey("vpcs.name"), nullable=False)
+    vpc_id = Column(String(100), ForeignKey("vpcs.name"), nullable=False, index=True)
 
     # Relationships
     address_pool = relationship("AddressPool", back_populates="pools")
@@ -78,13 +119,25 @@ class Pool(Base):
     def __repr__(self):
         return f"<Pool {self.name}: {self.cidr}>"
 
+    # Parsed network, built on first access and dropped when cidr changes
+    _network = None
+
     @property
     def network(self):
-        return ipaddress.IPv4Network(self.cidr, strict=False)
+        if self._network is None:
+            self._network = parse_network(self.cidr)
+        return self._network
+
+    @validates("cidr")
+    def _set_network_bounds(self, key, cidr):
+        self.network_start, self.network_end = cidr_bounds(cidr)
+        self._network = None
+        return cidr
 
     def contains(self, cidr):
         """Check if a CIDR is within this pool"""
-        return ipaddress.IPv4Network(cidr, strict=False).subnet_of(self.network)
+        start, end = cidr_bounds(cidr)
+        return self.network_start <= start and end <= self.network_end
 
 
 class Subnet(Base):
@@ -94,12 +147,18 @@ class Subnet(Base):
     __table_args__ = (UniqueConstraint("pool_id", "name", name="uq_subnet_pool_name"),)
 
     id = Column(Integer, primary_key=True, autoincrement=True)
-    name = Column(String(100), nullable=False)
+    # Indexed on its own for lookups by name alone (e.g. subnet delete)
+    name = Column(String(100), nullable=False, index=True)
     cidr = Column(String(18), nullable=False)
 
+    # Integer endpoints of cidr, kept in sync by _set_network_bounds
+    network_start = Column(BigInteger, index=True)
+    network_end = Column(BigInteger, index=True)
+
     # Foreign keys
+    # uq_subnet_pool_name already indexes (pool_id, name), which covers pool_id
     pool_id = Column(Integer, ForeignKey("pools.id"), nullable=False)
-    vpc_id = Column(String(100), ForeignKey("vpcs.name"), nullable=False)
+    vpc_id = Column(String(100), ForeignKey("vpcs.name"), nullable=False, index=True)
 
     # Relationships
     pool = relationship("Pool", back_populates="subnets")
@@ -108,10 +167,31 @@ class Subnet(Base):
     def __repr__(self):
         return f"<Subnet {self.name}: {self.cidr}>"
 
+    # Parsed network, built on first access and dropped when cidr changes
+    _network = None
+
     @property
     def network(self):
-        return ipaddress.IPv4Network(self.cidr, strict=False)
+        if self._network is None:
+            self._network = parse_network(self.cidr)
+        return self._network
+
+    @validates("cidr")
+    def _set_network_bounds(self, key, cidr):
+        self.network_start, self.network_end = cidr_bounds(cidr)
+        self._network = None
+        return cidr
 
     def contains(self, cidr):
         """Check if a CIDR is within this subnet"""
-        return ipaddress.IPv4Network(cidr, strict=False).subnet_of(self.network)
+        start, end = cidr_bounds(cidr)
+        return self.network_start <= start and end <= self.network_end
+
+
+class SchemaInfo(Base):
+    """Single row recording the schema version the database was migrated to"""
+
+    __tablename__ = "schema_info"
+
+    id = Column(Integer, primary_key=True)
+    version = Column(Integer, nullable=False)